@@ -0,0 +1,158 @@
+# Stress benchmark for large novels
+# builds synthetic 10k/50k/100k chapter novels and times each stage of main.py
+# per-chapter times should stay flat as the chapter count grows (linear scaling)
+import argparse, contextlib, json, os, re, tempfile, time, zipfile
+import requests
+
+from main import (
+    account_for_missing,
+    build_epub,
+    diff_homepage,
+    load_info,
+    load_metadata,
+    parsing,
+    path_setup,
+)
+from parser import Parser
+import search
+
+
+class SyntheticParser(Parser):
+    name = "synthetic"
+    base_url = "https://synthetic.invalid"
+
+    max_clients = 8
+
+    # pages are generated instead of downloaded
+    def grab(self, url, raw=False):
+        i = url.rsplit("-", 1)[1]
+        req = requests.Response()
+        req.status_code = 200
+        req.headers["content-type"] = "text/html; charset=utf-8"
+        req._content = (
+            f"<h1>Chapter {i}</h1><p>line one of {i}</p><p>synthetic ad</p><p>line two</p>"
+        ).encode("utf-8")
+        return req if raw else self._record_encoding(req).content
+
+    def parse_homepage(self, url):
+        # url ends with the chapter count, see synthetic_url
+        return synthetic_homepage(int(url.rsplit("-", 1)[1]))
+
+    def parse_chapter(self, html, blacklist):
+        html = self.decode(html)
+        title = re.search(r"<h1>(.*?)</h1>", html).group(1)
+        lines = [blacklist.sub("", l) for l in re.findall(r"<p>(.*?)</p>", html)]
+        return title, lines
+
+
+def synthetic_url(chapters):
+    return f"{SyntheticParser.base_url}/novel-{chapters}"
+
+
+def synthetic_homepage(chapters):
+    """homepage dict with every 100th chapter missing"""
+    links = {
+        i: f"{SyntheticParser.base_url}/chapter-{i}"
+        for i in range(1, chapters + 1)
+        if i % 100
+    }
+    return {
+        "title": f"Synthetic {chapters}",
+        "author": "benchmark",
+        "description": "synthetic novel",
+        "language": "en",
+        "image": f"{SyntheticParser.base_url}/cover.jpg",
+        "last": chapters,
+        "links": links,
+    }
+
+
+def timed(results, stage, chapters, func, *args, **kwargs):
+    # progress output is discarded so only the bookkeeping is timed
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        out = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    results.append((chapters, stage, elapsed))
+    return out
+
+
+def run(chapters, base, epub=True):
+    results = []
+    parser = SyntheticParser()
+    blacklist = re.compile(r"(?:%s)" % re.escape("synthetic ad"), flags=re.IGNORECASE)
+
+    homepage = parser.parse_homepage(synthetic_url(chapters))
+    paths = path_setup(base, homepage["title"], parser.name)
+    homepage["missing"] = account_for_missing(homepage["last"], homepage["links"], [])
+    with open(paths["info"], "w") as f:
+        f.write(json.dumps(homepage))
+
+    # homepage diffing against the archived info.json (one new chapter upstream)
+    updated = parser.parse_homepage(synthetic_url(chapters + 1))
+
+    def diff():
+        return diff_homepage(updated, load_info(paths["info"]))
+
+    timed(results, "homepage diff", chapters, diff)
+
+    with zipfile.ZipFile(paths["raw_zip"], "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i, link in homepage["links"].items():
+            zf.writestr(f"{i}.chapter", parser.grab(link))
+
+    index = search.open_index(os.path.join(base, "search_index.db"))
+    metadata = timed(
+        results,
+        "parsing",
+        chapters,
+        parsing,
+        paths["raw_zip"],
+        paths["parsed_zip"],
+        {},
+        list(homepage["links"].keys()),
+        parser,
+        blacklist,
+        index=index,
+        novel=os.path.basename(paths["dir"]),
+    )
+    index.close()
+
+    with open(paths["metadata"], "w") as f:
+        f.write(json.dumps(metadata))
+    timed(results, "metadata reload", chapters, load_metadata, paths["metadata"])
+
+    if epub:
+        timed(results, "epub assembly", chapters, build_epub, paths, homepage)
+
+    return results
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Stress benchmark with synthetic novels")
+    argparser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 50_000, 100_000],
+        help="chapter counts to benchmark (default: 10000 50000 100000)",
+    )
+    argparser.add_argument(
+        "--no-epub", action="store_true", help="skip the epub assembly stage"
+    )
+    args = argparser.parse_args()
+
+    results = []
+    for chapters in args.sizes:
+        print(f"benchmarking {chapters} chapters")
+        with tempfile.TemporaryDirectory() as base:
+            results += run(chapters, base, epub=not args.no_epub)
+
+    print(f"{'chapters':>10} {'stage':<16} {'seconds':>10} {'us/chapter':>12}")
+    for chapters, stage, elapsed in results:
+        print(
+            f"{chapters:>10} {stage:<16} {elapsed:>10.3f} {elapsed / chapters * 1e6:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
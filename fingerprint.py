@@ -0,0 +1,232 @@
+import copy, hashlib, inspect, json, os, re, sys
+from parser import Parser
+
+# each parsed chapter records what it was parsed from:
+#   parser: hash of the parser source (its module and parser.py)
+#   blacklist: hash of blacklist.txt at parse time
+#   raw: crc and size of the raw chapter in raw_chapters.zip
+#   matched: hashes of the blacklist phrases that were removed from it
+# so only chapters whose inputs changed need to be parsed again
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class Blacklist:
+    """
+    Blacklisted phrases (lines of blacklist.txt) compiled into one pattern
+    Each phrase is its own group so a match can be traced back to its phrase
+    Used in place of the Re.Pattern object parse_chapter takes
+    .sub can record matches, every other attribute is the compiled pattern's
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.hashes = [_hash(l) for l in lines]
+        self.hash = _hash("".join(self.hashes))
+        self.pattern = re.compile(
+            r"(?:%s)" % "|".join("(%s)" % re.escape(l) for l in lines),
+            flags=re.IGNORECASE,
+        )
+        self.matched = None
+
+    def sub(self, repl, string):
+        if self.matched is None:
+            return self.pattern.sub(repl, string)
+
+        def record(m):
+            if m.lastindex:
+                self.matched.add(self.hashes[m.lastindex - 1])
+            return repl
+
+        return self.pattern.sub(record, string)
+
+    def __getattr__(self, name):
+        # only called for attributes Blacklist doesn't have (copy looks some up before __init__ data exists)
+        if name == "pattern":
+            raise AttributeError(name)
+        return getattr(self.pattern, name)
+
+    def recorder(self):
+        """Returns a copy that records the hashes of matched phrases in .matched"""
+        rec = copy.copy(self)
+        rec.matched = set()
+        return rec
+
+
+class _Probe:
+    """
+    Stands in for the blacklist while parsing a chapter, so newly blacklisted
+    phrases are searched in the same text parse_chapter removes phrases from
+    """
+
+    def __init__(self, blacklist, added):
+        self.blacklist = blacklist
+        self.added = added
+        self.found = False
+
+    def sub(self, repl, string):
+        if not self.found and self.added.search(string):
+            self.found = True
+        return self.blacklist.sub(repl, string)
+
+    def __getattr__(self, name):
+        return getattr(self.blacklist, name)
+
+
+def _parsed_text(parsed, filename):
+    """Returns the text of a chapter in the parsed archive (tags removed), None if it isn't there"""
+    try:
+        html = parsed.read(filename).decode("utf-8")
+    except KeyError:
+        return None
+    return re.sub(r"<[^>]*>", "\n", html)
+
+
+def _has_added(parser, html, blacklist, added):
+    """Returns True if a newly blacklisted phrase appears in the text parse_chapter blacklists"""
+    probe = _Probe(blacklist, added)
+    try:
+        parser.parse_chapter(html, probe)
+    except Exception:
+        # can't tell, parse it again to be safe
+        return True
+    return probe.found
+
+
+def parser_version(parser):
+    """Returns hash of the parser's source, changes whenever the parser is edited"""
+    sources = [
+        inspect.getsource(sys.modules[cls.__module__]) for cls in (type(parser), Parser)
+    ]
+    return _hash("".join(sources))
+
+
+def raw_hash(zinfo):
+    """Fingerprint of a raw chapter from its zip entry (no need to read the chapter)"""
+    return f"{zinfo.CRC:08x}-{zinfo.file_size}"
+
+
+def load_fingerprints(file_name):
+    """Loads fingerprints.json, empty if it doesn't exist"""
+    if not os.path.isfile(file_name):
+        return {"blacklists": {}, "chapters": {}}
+
+    with open(file_name, "r") as f:
+        fingerprints = json.loads(f.read())
+    fingerprints["chapters"] = {int(k): v for k, v in fingerprints["chapters"].items()}
+    return fingerprints
+
+
+def save_fingerprints(file_name, fingerprints):
+    """Writes fingerprints.json, dropping blacklists no chapter refers to anymore"""
+    used = {fp["blacklist"] for fp in fingerprints["chapters"].values()}
+    fingerprints["blacklists"] = {
+        k: v for k, v in fingerprints["blacklists"].items() if k in used
+    }
+    with open(file_name, "w") as f:
+        f.write(json.dumps(fingerprints))
+
+
+def record(fingerprints, chn, version, blacklist, raw, matched):
+    """Records the fingerprint of chapter chn after it has been parsed"""
+    fingerprints["blacklists"][blacklist.hash] = blacklist.hashes
+    fingerprints["chapters"][chn] = {
+        "parser": version,
+        "blacklist": blacklist.hash,
+        "raw": raw,
+        "matched": sorted(matched),
+    }
+
+
+def _overlaps(a, b):
+    """Returns True if text matching phrase a can share characters with text matching phrase b"""
+    a, b = a.lower(), b.lower()
+    if a in b or b in a:
+        return True
+    return any(
+        a.endswith(b[:k]) or b.endswith(a[:k]) for k in range(1, min(len(a), len(b)))
+    )
+
+
+def _blacklist_changes(old_hashes, blacklist):
+    """
+    Returns tuple: (removed, added, overlapping)
+    removed: set of hashes of phrases no longer blacklisted
+    added: Re.Pattern matching any newly blacklisted phrase (None if there are none)
+    overlapping: set of hashes of kept phrases that can overlap a newly blacklisted one
+    """
+    old_hashes = set(old_hashes)
+    removed = old_hashes - set(blacklist.hashes)
+
+    # trailing newlines are part of each phrase, but not of the parsed text
+    phrases = [(l.strip(), h) for l, h in zip(blacklist.lines, blacklist.hashes) if l.strip()]
+    added = [l for l, h in phrases if h not in old_hashes]
+    if not added:
+        return removed, None, set()
+
+    overlapping = {
+        h for l, h in phrases if h in old_hashes and any(_overlaps(l, a) for a in added)
+    }
+    pattern = re.compile("|".join(re.escape(a) for a in added), flags=re.IGNORECASE)
+    return removed, pattern, overlapping
+
+
+def stale_chapters(fingerprints, zfo, keys, parser, blacklist, parsed=None):
+    """
+    Takes in fingerprints, open raw zip file, chapter numbers already parsed, parser and Blacklist
+    parsed: optional open parsed zip file, searched for newly blacklisted phrases
+            so most chapters don't need parsing to find out
+    Returns list of chapter numbers that need parsing again:
+        no fingerprint, parser changed, raw chapter changed,
+        a phrase it matched was removed from the blacklist,
+        or a newly blacklisted phrase appears in its text (as passed to blacklist.sub)
+    Chapters unaffected by blacklist edits are moved to the current blacklist
+    """
+    version = parser_version(parser)
+    changes = {}  # old blacklist hash -> (removed, added, overlapping)
+    stale = []
+
+    for chn in keys:
+        filename = f"{chn}.chapter"
+        try:
+            zinfo = zfo.getinfo(filename)
+        except KeyError:
+            continue
+
+        fp = fingerprints["chapters"].get(chn)
+        if fp is None or fp["parser"] != version or fp["raw"] != raw_hash(zinfo):
+            stale.append(chn)
+            continue
+
+        if fp["blacklist"] == blacklist.hash:
+            continue
+
+        if fp["blacklist"] not in changes:
+            changes[fp["blacklist"]] = _blacklist_changes(
+                fingerprints["blacklists"].get(fp["blacklist"], []), blacklist
+            )
+        removed, added, overlapping = changes[fp["blacklist"]]
+
+        if removed.intersection(fp["matched"]):
+            stale.append(chn)
+            continue
+
+        if added is not None:
+            text = None if parsed is None else _parsed_text(parsed, filename)
+            if text is not None and added.search(text):
+                stale.append(chn)
+                continue
+            # the parsed text lacks the phrases the old blacklist removed, a new phrase
+            # overlapping one of them is only found by parsing the raw chapter
+            if (text is None or overlapping.intersection(fp["matched"])) and _has_added(
+                parser, zfo.read(filename), blacklist, added
+            ):
+                stale.append(chn)
+                continue
+
+        fp["blacklist"] = blacklist.hash
+
+    fingerprints["blacklists"][blacklist.hash] = blacklist.hashes
+    return stale
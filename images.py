@@ -0,0 +1,112 @@
+import os, json, re, hashlib, mimetypes, zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import escape, unescape
+from ebooklib import epub
+
+# images are stored once per content hash, so an image repeated across
+# chapters (or served from several urls) is downloaded and embedded once
+
+
+def load_image_map(file_name):
+    """Loads images.json {url: stored file name}, empty if it doesn't exist"""
+    if not os.path.isfile(file_name):
+        return {}
+    with open(file_name, "r") as f:
+        return json.loads(f.read())
+
+
+def image_tag(url):
+    """html for an image reference returned by Parser.parse_chapter"""
+    return f'<img src="{escape(url)}" alt=""/>'
+
+
+def archived_image_urls(zip_name):
+    """Returns set of image urls referenced by the chapters in a parsed archive"""
+    urls = set()
+    with zipfile.ZipFile(zip_name, "r") as zf:
+        for filename in zf.namelist():
+            html = zf.read(filename).decode("utf-8")
+            urls.update(unescape(url) for url in re.findall(r'<img src="([^"]*)"', html))
+    return urls
+
+
+def _fetch(parser, url):
+    req = parser.grab(url, raw=True)
+    return url, req.content, req.headers.get("content-type", "")
+
+
+def _extension(url, content_type):
+    ext = mimetypes.guess_extension(content_type.split(";")[0].strip())
+    if ext is None:
+        ext = os.path.splitext(url.split("?")[0])[1] or ".img"
+    return ext
+
+
+def fetch_images(parser, urls, store_dir, map_file_name):
+    """
+    Downloads every url not already in the image map into store_dir (named by content hash)
+    Uses the parser's pooled client with max_clients concurrent requests
+    Returns updated image map {url: stored file name}
+    """
+    image_map = load_image_map(map_file_name)
+    to_fetch = [url for url in set(urls) if url not in image_map]
+
+    print(f"\tTo download: {len(to_fetch)} images")
+    if not to_fetch:
+        return image_map
+
+    os.makedirs(store_dir, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=parser.max_clients) as executor:
+        futures = [executor.submit(_fetch, parser, url) for url in to_fetch]
+
+        for fut in as_completed(futures):
+            try:
+                url, content, content_type = fut.result()
+            except Exception as e:
+                print(f"failed image download: {e}")
+                continue
+
+            digest = hashlib.sha256(content).hexdigest()
+            file_name = digest + _extension(url, content_type)
+            path = os.path.join(store_dir, file_name)
+            if not os.path.isfile(path):
+                with open(path, "wb") as f:
+                    f.write(content)
+            image_map[url] = file_name
+
+    with open(map_file_name, "w") as f:
+        f.write(json.dumps(image_map))
+
+    return image_map
+
+
+def embed_images(book, html, image_map, store_dir, embedded):
+    """
+    Points the images in chapter html at their stored copy, adding each stored file
+    to book once (embedded is the set of file names already added)
+    Images that were never downloaded keep their original url
+    Returns updated html
+    """
+
+    def replace(match):
+        url = unescape(match.group(1))
+        file_name = image_map.get(url)
+        if file_name is None:
+            return match.group(0)
+
+        if file_name not in embedded:
+            with open(os.path.join(store_dir, file_name), "rb") as f:
+                content = f.read()
+            book.add_item(
+                epub.EpubImage(
+                    uid=f"image_{file_name.split('.')[0]}",
+                    file_name=f"images/{file_name}",
+                    media_type=mimetypes.guess_type(file_name)[0] or "image/jpeg",
+                    content=content,
+                )
+            )
+            embedded.add(file_name)
+        return f'<img src="images/{file_name}"'
+
+    return re.sub(r'<img src="([^"]*)"', replace, html)
@@ -10,6 +10,20 @@ import importlib, pkgutil, inspect, modules
 import parsers
 from parser import Parser
 
+# for full-text search
+import time
+import search
+
+# for inline illustrations
+import images
+
+# for re-parsing only outdated chapters
+import fingerprint
+
+# for sharing downloads between machines
+import socket
+import workqueue
+
 def get_parsers():
     """Imports all parsers and returns a list of class names"""
     classes = []
@@ -60,75 +74,317 @@ def path_setup(base, novel_title, parser_name):
         "parsed_zip": os.path.join(full_path, "parsed_chapters.zip"),
         "info": os.path.join(full_path, "info.json"),
         "metadata": os.path.join(full_path, "metadata.json"),
+        "fingerprints": os.path.join(full_path, "fingerprints.json"),
         "epub": os.path.join(full_path, f"{novel_title}.epub"),
+        "images": os.path.join(full_path, "images"),
+        "image_map": os.path.join(full_path, "images.json"),
     }
 
 
+def load_info(file_name):
+    """Loads info.json (homepage dict) converting chapter numbers in links back to int"""
+    with open(file_name, "r") as f:
+        data = json.loads(f.read())
+    data["links"] = {int(k): v for k, v in data["links"].items()}
+    return data
+
+
+def load_metadata(file_name):
+    """Loads metadata.json converting chapter numbers back to int"""
+    with open(file_name, "r") as f:
+        return {int(k): v for k, v in json.loads(f.read()).items()}
+
+
+def account_for_missing(last, links, accounted):
+    """Returns list of chapter numbers up to last that have no link"""
+    # accounted logic broken rn (pray that website doesn't replace missing chapts)
+    return [i for i in range(1, last + 1) if i not in links]
+
+
+def diff_homepage(homepage, data):
+    """
+    Compares homepage with the archived homepage data (info.json)
+    Sets homepage["missing"]
+    Returns tuple: (up_to_date, set of chapter numbers to download)
+    """
+    homepage["missing"] = account_for_missing(
+        homepage["last"], homepage["links"], data["missing"]
+    )
+    if (data["last"] == homepage["last"]) and (data["links"] == homepage["links"]):
+        return True, set()
+    return False, set(homepage["links"].keys() - data["links"].keys())
+
+
 def print_bar(current_index, digits):
     """takes in an int: index int:digits\nreturns a string with str(current_index) with digits length\nEx. print_bar(10, 4) -> '0010'"""
     append = "0" * (digits - len(str(current_index)))
     return append + str(current_index)
 
 
-def parse_worker(zfo, chn, parser, blacklist):
+def parse_worker(zfo, chn, parser, blacklist, record=False):
     print(f"parsing chap: {print_bar(chn, 5)}", end="\r")
     filename = f"{chn}.chapter"
-    html = zfo.read(filename).decode("utf-8")
+    # raw bytes, decoded once inside the parser
+    html = zfo.read(filename)
+    if record:
+        # per chapter copy that tracks which blacklisted phrases were removed
+        blacklist = blacklist.recorder()
     title, body = parser.parse_chapter(html, blacklist)
-    return chn, title, body
-
-
-def parsing(zip_name_A, zip_name_B, metadata, keys, parser, blacklist):
+    return chn, title, body, blacklist.matched if record else None
+
+
+def remove_from_zip(zip_name, names):
+    """Rewrites zip_name without the entries in names (zip files can't delete in place)"""
+    if not os.path.isfile(zip_name):
+        return
+
+    with zipfile.ZipFile(zip_name, "r") as zf:
+        if not names.intersection(zf.namelist()):
+            return
+        tmp_name = zip_name + ".tmp"
+        with zipfile.ZipFile(tmp_name, "w", compression=zipfile.ZIP_DEFLATED) as zfn:
+            for info in zf.infolist():
+                if info.filename not in names:
+                    zfn.writestr(info, zf.read(info))
+    os.replace(tmp_name, zip_name)
+
+
+def parsing(
+    zip_name_A,
+    zip_name_B,
+    metadata,
+    keys,
+    parser,
+    blacklist,
+    index=None,
+    novel=None,
+    fingerprints=None,
+):
     """
     Takes in:
         zip_name_A: location of zip file with raw chapter html
         zip_name_B: location where zip file with parsed chapter htmls will be placed
         metadata: dict containing chapter titles
         keys: key names to be parsed from zip_name_A
+        index: optional sqlite3 connection to the full-text index (see search.py)
+               written in batches of search.INDEX_BATCH chapters
+        novel: name the chapters are indexed under
+        fingerprints: optional dict, updated with the fingerprint of each parsed chapter (see fingerprint.py)
+                      blacklist must then be a fingerprint.Blacklist
     Output:
         metadata: dict containing chapter titles updated with new info
     """
     print("beginning parsing")
 
+    # re-parsed chapters replace their old entry
+    remove_from_zip(zip_name_B, {f"{chn}.chapter" for chn in keys})
+
+    record = fingerprints is not None
+    if record:
+        version = fingerprint.parser_version(parser)
+
+    pending = []  # chapters not written to the index yet
     with zipfile.ZipFile(zip_name_A, "r") as zfo, zipfile.ZipFile(
         zip_name_B, "a", compression=zipfile.ZIP_DEFLATED
     ) as zfn:
 
         with ThreadPoolExecutor(max_workers=8) as pool:
-            futures = [pool.submit(parse_worker, zfo, chn, parser, blacklist) for chn in keys]
+            futures = [
+                pool.submit(parse_worker, zfo, chn, parser, blacklist, record)
+                for chn in keys
+            ]
 
             for fut in as_completed(futures):
-                chn, title, body = fut.result()
+                chn, title, body, matched = fut.result()
                 zfn.writestr(f"{chn}.chapter", body_list_to_html(title, body))
                 metadata[chn] = title
+                if index is not None:
+                    pending.append((chn, title, body))
+                    if len(pending) >= search.INDEX_BATCH:
+                        search.index_chapters(index, novel, pending)
+                        pending = []
+                if record:
+                    raw = fingerprint.raw_hash(zfo.getinfo(f"{chn}.chapter"))
+                    fingerprint.record(fingerprints, chn, version, blacklist, raw, matched)
+
+    if index is not None:
+        search.index_chapters(index, novel, pending)
     print()
     print("finished parsing")
     return metadata
 
 def body_list_to_html(title, body):
+    # image references become <img> tags, see Parser.parse_chapter
+    body = [images.image_tag(l["image"]) if isinstance(l, dict) else l for l in body]
     body_html = f"<h1>{title}</h1>\n" "<p>" + "</p><p>".join(body) + "</p>"
     return body_html
 
-def dl_chapter(i, zf, links, parser, zip_lock):
-    """Downloads chapter i from homepage['links'] writes it into zip file zf"""
+def build_epub(paths, homepage, cover_path=None, no_missing=False):
+    """
+    Builds the epub at paths["epub"] from the parsed archive and metadata
+    cover_path: image added as the cover (skipped if None or not on disk)
+    no_missing: don't add placeholder pages for missing chapters
+    Downloaded inline images (see images.py) are embedded once each
+    """
+    book = epub.EpubBook()
+
+    book.set_title(homepage["title"])
+    book.set_language(homepage["language"])
+    book.add_author(homepage["author"])
+    book.add_metadata("DC", "description", homepage["description"])
+
+    if cover_path is not None and os.path.isfile(cover_path):
+        book.set_cover(os.path.basename(cover_path), open(cover_path, "rb").read())
+    else:
+        print("no cover")
+
+    # Ensure correct version of metadata is loaded
+    with open(paths["metadata"], "r") as f:
+        metadata = json.loads(f.read())
+
+    chapter_list = []
+    missing = set(homepage["missing"])
+
+    image_map = images.load_image_map(paths["image_map"])
+    embedded = set()
+
+    # Reading from parsed archive and building epub
+    # memory heavy step, all chapters must be stored in memory
+    with zipfile.ZipFile(paths["parsed_zip"], "r") as zf:
+        for i in range(1, homepage["last"] + 1):
+            print(f"building ch for ch {print_bar(i, 5)}", end="\r")
+            if i in missing:
+                if no_missing:
+                    print("ignoring missing", i)
+                    continue
+                print()
+                print("missing chap", i)
+                ch_t = f"Chapter {i}: Missing"
+                ch_b = f"<h1>Missing Chapter {i}</h1><p>No content found for ch:{i}</p><p>I suggest you look for it online</p><p><a href=\"https://www.google.com/search?q={homepage['title']}+chapter+{i}\" rel=\"noreferrer\">search on google</a></p>"
+            else:
+                filename = f"{i}.chapter"
+                html = zf.read(filename).decode("utf-8")
+                ch_b = images.embed_images(book, html, image_map, paths["images"], embedded)
+                ch_t = metadata[str(i)]
+
+            ch = epub.EpubHtml(title=ch_t, file_name=f"{i}.xhtml")
+            ch.content = ch_b
+            book.add_item(ch)
+            chapter_list.append(ch)
+    print()
+    print("finised added chapters")
+    clt = tuple(chapter_list)
+    book.toc = clt
+    book.spine = ["nav"] + chapter_list
+    book.add_item(epub.EpubNav())
+
+    epub.write_epub(paths["epub"], book)
+
+
+def dl_chapter(i, zf, links, parser, zip_lock, trim=True):
+    """Downloads chapter i from homepage['links'] writes it into zip file zf
+    trim: only keep the chapter title and content (see Parser.trim_chapter)"""
     print(f"Downloading CH: {print_bar(i, 5)}", end="\r")
 
     if i not in links:
         print(f"Skipping missing chapter {i}")
     else:
         filename = f"{i}.chapter"
-        data = parser.grab(links[i])
+        data = parser.grab_chapter(links[i])
+        if trim:
+            data = parser.trim_chapter(data)
         with zip_lock:
             zf.writestr(filename, data)
 
 
+def queue_worker(queue_file_name, batch, lease, timeout=None, hedge=True):
+    """
+    Claims chapter ranges from the shared queue (see workqueue.py), downloads them
+    with max_clients threads and uploads the raw html until the queue is empty
+    """
+    conn = workqueue.open_queue(queue_file_name)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    novel_parsers = {}
+
+    print(f"worker {worker} started")
+    while True:
+        tasks = workqueue.claim(conn, worker, batch, lease)
+        if not tasks:
+            if workqueue.remaining(conn) == 0:
+                break
+            # the rest is claimed by other workers, wait in case a lease expires
+            time.sleep(5)
+            continue
+
+        novel = tasks[0][0]
+        if novel not in novel_parsers:
+            url, trim = workqueue.novel_info(conn, novel)
+            parser = get_parser(url)()
+            if timeout:
+                parser.timeout = timeout
+            parser.hedge = hedge
+            novel_parsers[novel] = (parser, trim)
+        parser, trim = novel_parsers[novel]
+
+        def download(url):
+            data = parser.grab_chapter(url)
+            return parser.trim_chapter(data) if trim else data
+
+        with ThreadPoolExecutor(max_workers=parser.max_clients) as executor:
+            futures = {
+                executor.submit(download, url): chn for _, chn, url in tasks
+            }
+            for fut in as_completed(futures):
+                chn = futures[fut]
+                print(f"Downloading CH: {print_bar(chn, 5)}", end="\r")
+                try:
+                    workqueue.complete(conn, worker, novel, chn, fut.result())
+                except Exception as e:
+                    print(f"\nfailed chapter {chn}: {e}")
+                    workqueue.release(conn, worker, novel, chn)
+                workqueue.renew(conn, worker, lease)
+
+    print()
+    print("queue empty, worker done")
+
+
+def queue_download(queue_file_name, novel, url, links, zip_name, trim=True):
+    """
+    Publishes links {chapter: url} to the shared queue and merges the chapters
+    uploaded by workers into zip_name until every chapter is downloaded
+    Returns list of chapters that failed on every attempt
+    """
+    # a coordinator restarted before info.json was written asks for every chapter again
+    if os.path.isfile(zip_name):
+        with zipfile.ZipFile(zip_name, "r") as zf:
+            archived = set(zf.namelist())
+        links = {chn: link for chn, link in links.items() if f"{chn}.chapter" not in archived}
+
+    conn = workqueue.open_queue(queue_file_name)
+    workqueue.publish(conn, novel, url, links, trim=trim)
+    print(f"Published {len(links)} chapters to {queue_file_name}, waiting for workers")
+
+    merged = 0
+    while True:
+        merged += workqueue.merge(conn, novel, zip_name)
+        remaining = workqueue.remaining(conn, novel)
+        print(f"Merged: {print_bar(merged, 5)} Remaining: {print_bar(remaining, 5)}", end="\r")
+        if remaining == 0:
+            break
+        time.sleep(5)
+
+    # last uploads may have landed after the final merge
+    workqueue.merge(conn, novel, zip_name)
+    return workqueue.failed(conn, novel)
+
+
 def get_args():
     parser = argparse.ArgumentParser(
         description="Scrape web novels from various sources and convert them to EPUB."
     )
 
-    # The URL is a required arg
-    parser.add_argument("url", help="The homepage URL of the novel")
+    # The URL is required unless searching
+    parser.add_argument("url", nargs="?", help="The homepage URL of the novel")
 
     parser.add_argument(
         "--parsers",
@@ -174,6 +430,74 @@ def get_args():
         help="Doesn't download or add cover to epub",
     )
 
+    parser.add_argument(
+        "--keep-full-pages",
+        action="store_true",
+        help="Store full chapter pages in the raw archive instead of only the chapter content",
+    )
+
+    parser.add_argument(
+        "--no-images",
+        action="store_true",
+        help="Doesn't download inline chapter images",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Seconds before a request is given up on (default: per site, usually 30)",
+    )
+
+    parser.add_argument(
+        "--no-hedge",
+        action="store_true",
+        help="Don't send a duplicate request when a response is slower than usual",
+    )
+
+    parser.add_argument(
+        "--queue",
+        metavar="QUEUE_FILE",
+        help="Publish downloads to a shared queue file for --worker processes instead of downloading here",
+    )
+
+    parser.add_argument(
+        "--worker",
+        metavar="QUEUE_FILE",
+        help="Download chapters published to a shared queue file until it is empty",
+    )
+
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=20,
+        help="Chapters a worker claims at a time (default: 20)",
+    )
+
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=300,
+        help="Seconds before chapters claimed by an unresponsive worker go back to the queue (default: 300)",
+    )
+
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Doesn't add parsed chapters to the full-text search index",
+    )
+
+    parser.add_argument(
+        "--search",
+        metavar="PHRASE",
+        help="Search archived novels in the output directory for a phrase",
+    )
+
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Rebuild the full-text search index from the archives in the output directory",
+    )
+
     return parser.parse_args()
 
 
@@ -185,9 +509,7 @@ def main():
         for line in f:
             BLACKLIST.append(line)
 
-    BLACKLIST_RE = re.compile(
-        r"(?:%s)" % "|".join(map(re.escape, BLACKLIST)), flags=re.IGNORECASE
-    )
+    BLACKLIST_RE = fingerprint.Blacklist(BLACKLIST)
 
     zip_lock = Lock()
 
@@ -198,9 +520,49 @@ def main():
             print(parser.name)
         sys.exit(1)
 
+    if args.rebuild_index:
+        total = search.rebuild_index(args.output)
+        print(f"indexed {total} chapters")
+        sys.exit(0)
+
+    if args.search:
+        index_file_name = search.index_path(args.output)
+        if not os.path.isfile(index_file_name):
+            print("No search index found (use --rebuild-index)")
+            sys.exit(1)
+        index = search.open_index(index_file_name)
+        start = time.perf_counter()
+        results = search.search(index, args.search)
+        elapsed = (time.perf_counter() - start) * 1000
+        for novel, chn, title, snippet in results:
+            print(f"{novel} - ch {chn}: {title}")
+            snippet = snippet.replace("\n", " ")
+            print(f"\t{snippet}")
+        print(f"{len(results)} results in {elapsed:.1f}ms")
+        sys.exit(0)
+
+    if args.worker:
+        queue_worker(
+            args.worker,
+            args.batch,
+            args.lease,
+            timeout=args.timeout,
+            hedge=not args.no_hedge,
+        )
+        sys.exit(0)
+
+    if args.url is None:
+        print("A novel URL is required")
+        sys.exit(1)
+
     ParserClass = get_parser(args.url)
     parser = ParserClass()
 
+    if args.timeout:
+        parser.timeout = args.timeout
+    if args.no_hedge:
+        parser.hedge = False
+
     homepage = parser.parse_homepage(args.url)
     paths = path_setup(args.output, homepage["title"], parser.name)
 
@@ -220,43 +582,27 @@ def main():
     zip_name_B = paths["parsed_zip"]
     metadata_file_name = paths["metadata"]
 
-    def account_for_missing(last, links, accounted):
-        still_missing = []
-        for i in range(1, last + 1):
-            if not i in links:
-                # accounted logic broken rn (pray that website doesn't replace missing chapts)
-                # if i in accounted:
-                #    continue
-                still_missing.append(i)
-        return still_missing
-
     # have keys_to_download contain only new chaps keys
     # works by removing the old keys from the new keys
     if os.path.isfile(zip_name_A) and os.path.isfile(homepage_file_name):
         print("\tArchive found - Checking for updates")
         print("-----------")
 
-        with open(homepage_file_name, "r") as f:
-            data = json.loads(
-                f.read(),
-                object_hook=lambda d: {
-                    int(k) if k.lstrip("-").isdigit() else k: v for k, v in d.items()
-                },
-            )
-        homepage["missing"] = account_for_missing(
-            homepage["last"], homepage["links"], data["missing"]
-        )
+        data = load_info(homepage_file_name)
+        up_to_date, keys_to_download = diff_homepage(homepage, data)
+
+        # archived chapters keep the encoding they were downloaded in
+        # (archives without one were stored as utf-8)
+        parser.encoding = data.get("encoding", "utf-8")
 
         print("-----------")
         print("Archive has: ")
         print(f"\tLast Chapter: {data["last"]}")
         print(f"\tTotal Chapters: {len(data["links"])}")
-        if (data["last"] == homepage["last"]) and (data["links"] == homepage["links"]):
+        if up_to_date:
             print("\tArchive up to date")
-            keys_to_download = set()
         else:
             print("\tArchive not up to date")
-            keys_to_download = set(homepage["links"].keys() - data["links"].keys())
         print("-----------")
     else:
         print("\tNo archive found - No missing accounted for")
@@ -294,13 +640,37 @@ def main():
         print("Nothing to do; Skipping downloads")
     elif args.no_download:
         print("Skipping downloads (could cause errors)")
+    elif args.queue:
+        # workers download, this process merges into the zip file
+        # keyed on the full path so novels with the same folder name in
+        # different output directories don't share chapters
+        failed = queue_download(
+            args.queue,
+            os.path.abspath(paths["dir"]),
+            args.url,
+            {i: homepage["links"][i] for i in keys_to_download},
+            zip_name_A,
+            trim=not args.keep_full_pages,
+        )
+        if failed:
+            print()
+            print(f"Failed chapters: {failed}")
+            sys.exit(1)
     else:
         # create/append to zip file using multithreaded parsers
         with zipfile.ZipFile(zip_name_A, "a", compression=zipfile.ZIP_DEFLATED) as zf:
             with ThreadPoolExecutor(max_workers=parser.max_clients) as executor:
                 list(
                     executor.map(
-                        lambda i: dl_chapter(i, zf, homepage["links"], parser, zip_lock), keys_to_download
+                        lambda i: dl_chapter(
+                            i,
+                            zf,
+                            homepage["links"],
+                            parser,
+                            zip_lock,
+                            trim=not args.keep_full_pages,
+                        ),
+                        keys_to_download,
                     )
                 )
     print()
@@ -321,6 +691,7 @@ def main():
             f.write(req.content)
 
     # write homepage to disk for future use
+    homepage["encoding"] = parser.encoding
     with open(homepage_file_name, "w") as f:
         f.write(json.dumps(homepage))
 
@@ -330,22 +701,29 @@ def main():
     if os.path.isfile(metadata_file_name):
         print("\tmetadata found successfully")
 
-        # quick convert from json to python dict
-        with open(metadata_file_name, "r") as f:
-            metadata = json.loads(
-                f.read(),
-                object_hook=lambda d: {
-                    # converts string key names to int
-                    int(k) if k.lstrip("-").isdigit() else k: v
-                    for k, v in d.items()
-                },
-            )
+        metadata = load_metadata(metadata_file_name)
+        fingerprints = fingerprint.load_fingerprints(paths["fingerprints"])
 
         # parsed archive found, only need to parse new chapters
-        keys_to_parse = keys_to_download
+        # and the ones whose parser, raw html or blacklist matches changed
+        with zipfile.ZipFile(zip_name_A, "r") as zfo:
+            parsed = zipfile.ZipFile(zip_name_B, "r") if os.path.isfile(zip_name_B) else None
+            outdated = fingerprint.stale_chapters(
+                fingerprints,
+                zfo,
+                homepage["links"].keys() - set(keys_to_download),
+                parser,
+                BLACKLIST_RE,
+                parsed=parsed,
+            )
+            if parsed is not None:
+                parsed.close()
+        print(f"\tOutdated: {len(outdated)} chapters")
+        keys_to_parse = keys_to_download + outdated
     else:
         print("\tno previous metadata found...")
         metadata = {}
+        fingerprints = fingerprint.load_fingerprints(paths["fingerprints"])
         # if theres no metadata, no parsed archive exists
         # keys_to_parse must include all chapters
         keys_to_parse = list(homepage["links"].keys())
@@ -369,7 +747,20 @@ def main():
     elif args.no_parse:
         print("Skipping parse (could cause errors)")
     else:
-        metadata = parsing(zip_name_A, zip_name_B, metadata, keys_to_parse, parser, BLACKLIST_RE)
+        index = None if args.no_index else search.open_index(search.index_path(args.output))
+        metadata = parsing(
+            zip_name_A,
+            zip_name_B,
+            metadata,
+            keys_to_parse,
+            parser,
+            BLACKLIST_RE,
+            index=index,
+            novel=os.path.basename(paths["dir"]),
+            fingerprints=fingerprints,
+        )
+        if index is not None:
+            index.close()
 
     print("-----------")
 
@@ -378,6 +769,14 @@ def main():
         f.write(
             json.dumps(metadata)
         )  # maybe delete metadata cause need to re-soup all files anyways
+    fingerprint.save_fingerprints(paths["fingerprints"], fingerprints)
+
+    # images of every archived chapter, so earlier failed or skipped downloads are retried
+    if args.no_images:
+        print("Skipping images")
+    elif os.path.isfile(zip_name_B):
+        image_urls = images.archived_image_urls(zip_name_B)
+        images.fetch_images(parser, image_urls, paths["images"], paths["image_map"])
 
     # Step 3 - combine files in parsed archive into a epub file
 
@@ -392,58 +791,8 @@ def main():
             print("Exiting")
             sys.exit(1)
 
-    book = epub.EpubBook()
-
-    book.set_title(homepage["title"])
-    book.set_language(homepage["language"])
-    book.add_author(homepage["author"])
-    book.add_metadata("DC", "description", homepage["description"])
-
-    if not args.no_cover and os.path.isfile(image_path):
-        book.set_cover(f"cover{image_ext}", open(image_path, "rb").read())
-    else:
-        print("no cover")
-
-    # Ensure correct version of metadata is loaded
-    with open(metadata_file_name, "r") as f:
-        metadata = json.loads(f.read())
-
-    chapter_list = []
-
-    # Reading from parsed archive and building epub
-    # memory heavy step, all chapters must be stored in memory
-    with zipfile.ZipFile(zip_name_B, "r") as zf:
-        for i in range(1, homepage["last"] + 1):
-            print(f"building ch for ch {print_bar(i, 5)}", end="\r")
-            if i in homepage["missing"]:
-                if args.no_missing:
-                    print("ignoring missing", i)
-                    continue
-                print()
-                print("missing chap", i)
-                ch_t = f"Chapter {i}: Missing"
-                ch_b = f"<h1>Missing Chapter {i}</h1><p>No content found for ch:{i}</p><p>I suggest you look for it online</p><p><a href=\"https://www.google.com/search?q={homepage['title']}+chapter+{i}\" rel=\"noreferrer\">search on google</a></p>"
-            else:
-                filename = f"{i}.chapter"
-                html = zf.read(filename).decode("utf-8")
-                ch_b = html
-                ch_t = metadata[str(i)]
-
-            ch = epub.EpubHtml(title=ch_t, file_name=f"{i}.xhtml")
-            ch.content = ch_b
-            book.add_item(ch)
-            chapter_list.append(ch)
-    print()
-    print("finised added chapters")
-    clt = tuple(chapter_list)
-    book.toc = clt
-    cln = ["nav"]
-    for item in chapter_list:
-        cln.append(item)
-    book.spine = cln
-    book.add_item(epub.EpubNav())
-
-    epub.write_epub(paths["epub"], book)
+    cover_path = None if args.no_cover else image_path
+    build_epub(paths, homepage, cover_path=cover_path, no_missing=args.no_missing)
     print("Book written successfully")
     print("============")
     print(os.path.abspath(paths["epub"]))
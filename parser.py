@@ -1,4 +1,25 @@
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from threading import BoundedSemaphore, Lock, Thread
+from urllib.parse import urljoin
+import codecs, re, time
+import requests
+
+# marks where an <img> was in chapter text, see Parser._mark_images
+IMAGE_MARK = "\x00image:"
+
+# html that can contain tag-like text, skipped when looking for closing tags
+SKIPPED_HTML = rb"<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>"
+
+# attributes of a tag, quoted values can contain ">"
+TAG_ATTRS = rb"""(?:"[^"]*"|'[^']*'|[^'">])*"""
+
+# charset declared in the page itself, <meta charset="..."> or <meta http-equiv ... content="...; charset=...">
+META_CHARSET = rb"""<meta\b[^>]*?charset\s*=\s*["']?([\w.:-]+)"""
+
+# blacklist that never matches, used when comparing trimmed and full pages
+NO_BLACKLIST = re.compile(r"(?!)")
 
 
 # Base parser, all the parsers are based off of this
@@ -13,14 +34,301 @@ class Parser(ABC):
     # Integer max_clients
     max_clients = None
 
+    # page encoding, recorded once per site from the first response
+    # main.py keeps it in info.json so archived chapters are decoded with it later
+    # String encoding
+    encoding = None
+
+    # byte regexes matching the opening tag of each element parse_chapter reads
+    # trim_chapter keeps only these elements when archiving raw chapters
+    # List trim_regions
+    trim_regions = None
+
+    # number of trimmed pages checked against the full page (two full parses each)
+    # before the regex cut is trusted for the rest of the run
+    # Integer trim_checks
+    trim_checks = 5
+
+    # seconds before a request is given up on
+    # Float timeout
+    timeout = 30
+
+    # fire a duplicate request when a response is slower than the p95 latency
+    # first response wins, hedge_delay is used until enough latencies are recorded
+    # at most hedge_budget hedges are in flight, so a site sees at most
+    # max_clients + hedge_budget connections
+    # Boolean hedge, Float hedge_delay, Integer hedge_budget
+    hedge = True
+    hedge_delay = 5
+    hedge_budget = 1
+
+    # alternate base urls tried when a chapter fails to download
+    # List mirrors
+    mirrors = []
+
+    def __init__(self):
+        # max_clients requests plus the hedges in flight
+        # a request that lost to its hedge (or the other way round) still holds
+        # its slot until it finishes or times out, its connection is still open
+        clients = self.max_clients or 1
+
+        # pooled connections shared by every grab
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=clients + self.hedge_budget)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._trim_lock = Lock()
+        self._trim_checks_left = self.trim_checks
+        self._trim_failed = False
+
+        self._slots = BoundedSemaphore(clients)
+        self._hedge_slots = BoundedSemaphore(self.hedge_budget)
+        self._latencies = deque(maxlen=200)
+        self._latency_lock = Lock()
+
     @abstractmethod
     def grab(self, url, raw=False):
         """
         Takes url
-        Returns plain html (usually request.text)
+        Returns raw html bytes (usually self._record_encoding(self._get(url)).content)
+        Returns the response object itself if raw
         """
         pass
 
+    def grab_chapter(self, url):
+        """
+        Takes chapter url
+        Returns raw html bytes, trying each of mirrors in turn if the main site fails
+        """
+        urls = [url]
+        if url.startswith(self.base_url):
+            urls += [url.replace(self.base_url, m, 1) for m in self.mirrors]
+
+        for i, u in enumerate(urls):
+            try:
+                return self.grab(u)
+            except requests.RequestException as e:
+                if i == len(urls) - 1:
+                    raise
+                print(f"\n{e} - trying mirror {urls[i + 1]}")
+
+    def _get(self, url, headers=None):
+        """
+        Takes url and optional headers
+        Returns response, hedged with a duplicate request if the first is slower than usual
+        Raises requests.RequestException on timeouts and error status codes
+        """
+        self._slots.acquire()
+        if not self.hedge:
+            try:
+                return self._timed_get(url, headers)
+            finally:
+                self._slots.release()
+
+        first = self._launch(url, headers, self._slots)
+        done, _ = wait([first], timeout=self._hedge_delay())
+
+        # no hedge if the hedge budget is used up
+        if done or not self._hedge_slots.acquire(blocking=False):
+            return first.result()
+
+        pending = {first, self._launch(url, headers, self._hedge_slots)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    return fut.result()
+
+        # both requests failed
+        return first.result()
+
+    def _launch(self, url, headers, slots):
+        """
+        Runs _timed_get on its own thread, the caller must hold one of slots
+        The slot is released when the request finishes, even if nobody waits for it anymore
+        Returns Future
+        """
+        fut = Future()
+
+        def run():
+            try:
+                fut.set_result(self._timed_get(url, headers))
+            except Exception as e:
+                fut.set_exception(e)
+            finally:
+                slots.release()
+
+        Thread(target=run, daemon=True).start()
+        return fut
+
+    def _timed_get(self, url, headers=None):
+        """Single GET request, records its latency if successful"""
+        start = time.perf_counter()
+        req = self.session.get(url, headers=headers, timeout=self.timeout)
+        req.raise_for_status()
+
+        with self._latency_lock:
+            self._latencies.append(time.perf_counter() - start)
+        return req
+
+    def _hedge_delay(self):
+        """Returns seconds to wait before hedging (p95 of recent latencies)"""
+        with self._latency_lock:
+            latencies = sorted(self._latencies)
+
+        if len(latencies) < 20:
+            return self.hedge_delay
+        return latencies[int(len(latencies) * 0.95)]
+
+    def _record_encoding(self, req):
+        """
+        Takes in a response, records the site encoding if not known yet
+        Uses the charset from the headers, then a <meta> charset in the page,
+        and only runs detection on the first response if neither is declared
+        Returns the response
+        """
+        if self.encoding is None:
+            if "charset" in req.headers.get("content-type", "").lower():
+                self.encoding = requests.utils.get_encoding_from_headers(req.headers)
+            else:
+                self.encoding = self._meta_encoding(req.content) or self._detect_encoding(req)
+        return req
+
+    def _meta_encoding(self, html):
+        """Returns the charset declared by a <meta> tag near the top of html, None if there is none"""
+        m = re.search(META_CHARSET, html[:4096], flags=re.IGNORECASE)
+        if m is None:
+            return None
+        try:
+            return codecs.lookup(m.group(1).decode("ascii")).name
+        except LookupError:
+            return None
+
+    def _detect_encoding(self, req):
+        """Returns the detected encoding of a response, utf-8 when the page is plain ascii"""
+        encoding = req.apparent_encoding
+        # an ascii-only page (usually the homepage) says nothing about the chapters,
+        # and utf-8 decodes ascii the same
+        if encoding is None or codecs.lookup(encoding).name == "ascii":
+            return "utf-8"
+        return encoding
+
+    def decode(self, html):
+        """
+        Takes in raw html bytes (or an already decoded string)
+        Returns html as a string decoded with the site encoding
+        """
+        if isinstance(html, str):
+            return html
+        return html.decode(self.encoding or "utf-8", errors="replace")
+
+    def trim_chapter(self, html):
+        """
+        Takes in raw chapter html bytes
+        Returns bytes containing only the elements matched by trim_regions
+        Returns html unchanged if trim_regions is not set or a region can't be found
+        The first trim_checks pages are parsed trimmed and full, if one differs
+        trimming is turned off for the rest of the run
+        """
+        if not self.trim_regions or self._trim_failed:
+            return html
+
+        trimmed = self._cut_regions(html)
+        if trimmed is None:
+            return html
+
+        with self._trim_lock:
+            check = self._trim_checks_left > 0
+            if check:
+                self._trim_checks_left -= 1
+        if not check:
+            return trimmed
+
+        # the raw archive is the only source for later re-parses,
+        # so never keep a trimmed page that lost anything
+        try:
+            full = self.parse_chapter(html, NO_BLACKLIST)
+        except Exception:
+            # not a chapter page, nothing to compare against
+            return html
+        try:
+            if self.parse_chapter(trimmed, NO_BLACKLIST) == full:
+                return trimmed
+        except Exception:
+            pass
+
+        print("\ntrimmed page differs from the full page, keeping full pages")
+        self._trim_failed = True
+        return html
+
+    def _cut_regions(self, html):
+        """
+        Takes in raw chapter html bytes
+        Returns the elements matched by trim_regions in a minimal page
+        Returns None if a region can't be found or isn't closed
+        """
+        parts = []
+        for region in self.trim_regions:
+            start = re.search(region, html)
+            if start is None:
+                return None
+            end = self._find_closing(html, start)
+            if end is None:
+                return None
+            parts.append(html[start.start() : end])
+
+        return b"<html><body>\n" + b"\n".join(parts) + b"\n</body></html>"
+
+    def _find_closing(self, html, start):
+        """
+        Takes in html bytes and the match of an opening tag
+        Returns index just past its closing tag (nested tags of the same name are counted)
+        Comments, scripts and styles are skipped
+        Returns None if the element is never closed
+        """
+        tag = re.match(rb"<([a-zA-Z0-9]+)", start.group()).group(1)
+        tags = re.compile(
+            SKIPPED_HTML + rb"|<(/?)" + tag + rb"\b" + TAG_ATTRS + rb">",
+            flags=re.IGNORECASE | re.DOTALL,
+        )
+
+        depth = 1
+        for m in tags.finditer(html, start.end()):
+            if m.group(1) is None:
+                continue
+            if m.group(1):
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+            elif not m.group().endswith(b"/>"):
+                depth += 1
+        return None
+
+    def _mark_images(self, element):
+        """
+        Takes in a soup element
+        Replaces each <img> inside with a marker line so it survives get_text()
+        Returns element
+        """
+        for img in element.find_all("img"):
+            src = img.get("data-src") or img.get("src")
+            if src:
+                img.replace_with(f"\n{IMAGE_MARK}{urljoin(self.base_url, src)}\n")
+            else:
+                img.decompose()
+        return element
+
+    def _image_refs(self, lines):
+        """
+        Takes in body lines
+        Returns lines with image marker lines turned into image references {"image": url}
+        """
+        return [
+            {"image": l[len(IMAGE_MARK) :]} if l.startswith(IMAGE_MARK) else l
+            for l in lines
+        ]
+
     @abstractmethod
     def parse_homepage(self, url):
         """
@@ -42,8 +350,10 @@ class Parser(ABC):
     @abstractmethod
     def parse_chapter(self, html, blacklist):
         """
-        Takes in raw chapter HTML, and Re.Pattern object
+        Takes in raw chapter HTML bytes, and Re.Pattern object
+        html should be decoded once here with self.decode(html)
         Return tuple: (chapter_title, body_list)
         body_list contains each line or portion of text that should be contained within a <p> tag as each row
+        rows can also be image references {"image": url} (see _mark_images and _image_refs)
         """
         pass
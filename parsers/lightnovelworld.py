@@ -1,6 +1,5 @@
 from bs4 import BeautifulSoup
 import re
-import requests
 from parser import Parser
 
 
@@ -10,17 +9,23 @@ class LightNovelWorldParser(Parser):
 
     max_clients = 2
 
+    # chapter title and content, see parse_chapter
+    trim_regions = [
+        rb'<h1[^>]*class="[^"]*\bchapter-title\b[^>]*>',
+        rb'<div[^>]*id="chapterText"[^>]*>',
+    ]
+
     def grab(self, url, raw=False):
         # lightnovelworld requires an agent request
         AGENT = (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/105.0.0.0 Safari/537.36"
         )
-        req = requests.get(url, headers={"User-Agent": AGENT})
-        return req if raw else req.text
+        req = self._get(url, headers={"User-Agent": AGENT})
+        return req if raw else self._record_encoding(req).content
 
     def _scrape_chapter_list(self, html, last):
         """lightnovelworld has an inconvenient page-based chapters page"""
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         chapter_links = {}
 
@@ -36,7 +41,7 @@ class LightNovelWorldParser(Parser):
 
     def parse_homepage(self, url):
         html = self.grab(url)
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         title = soup.find("h1", {"class": "novel-title"}).text
         author = soup.find("p", {"class": "novel-author"}).text
@@ -49,7 +54,7 @@ class LightNovelWorldParser(Parser):
         # need to get the other chapter page ids
         chapter1_html = self.grab(f"{url_chapters}1")
 
-        soupch = BeautifulSoup(chapter1_html, "lxml")
+        soupch = BeautifulSoup(self.decode(chapter1_html), "lxml")
 
         # gets the id for each page of chapters without crashing
         pages_num = [
@@ -78,11 +83,11 @@ class LightNovelWorldParser(Parser):
         }
 
     def parse_chapter(self, html, blacklist):
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         ch_title = soup.find("h1", {"class": "chapter-title"}).get_text(strip=True)
 
-        body = soup.find("div", {"id": "chapterText"})
+        body = self._mark_images(soup.find("div", {"id": "chapterText"}))
         body_str = "\n".join([x.get_text() for x in body])
 
         # Removing blacklisted text
@@ -91,4 +96,4 @@ class LightNovelWorldParser(Parser):
 
         lines = [l.strip() for l in cleaned_body.splitlines() if l.strip()]
 
-        return ch_title, lines
+        return ch_title, self._image_refs(lines)
@@ -1,6 +1,5 @@
 from bs4 import BeautifulSoup
 import re
-import requests
 from parser import Parser
 
 
@@ -10,9 +9,15 @@ class ReaderNovelParser(Parser):
 
     max_clients = 10
 
+    # chapter title and content, see parse_chapter
+    trim_regions = [
+        rb'<span[^>]*class="[^"]*\bchapter-title\b[^>]*>',
+        rb'<div[^>]*id="chapter-container"[^>]*>',
+    ]
+
     def grab(self, url, raw=False):
-        req = requests.get(url)
-        return req if raw else req.text
+        req = self._get(url)
+        return req if raw else self._record_encoding(req).content
 
     def _link_to_num(self, link):
         match = re.findall(r"(\d+)", link)[2]
@@ -20,7 +25,7 @@ class ReaderNovelParser(Parser):
 
     def parse_homepage(self, url):
         html = self.grab(url)
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         title = soup.find("h1", {"class": "page-title"}).text
         desc = soup.find("div", {"id": "collapseSummary"}).text.strip()
@@ -62,11 +67,11 @@ class ReaderNovelParser(Parser):
         }
 
     def parse_chapter(self, html, blacklist):
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         ch_title = soup.find("span", {"class": "chapter-title"}).get_text(strip=True)
 
-        body = soup.find("div", {"id": "chapter-container"}).get_text()
+        body = self._mark_images(soup.find("div", {"id": "chapter-container"})).get_text()
 
         # Removing blacklisted text
         cleaned_body = blacklist.sub("", body)
@@ -74,4 +79,4 @@ class ReaderNovelParser(Parser):
 
         lines = [l.strip() for l in cleaned_body.splitlines() if l.strip()]
 
-        return ch_title, lines
+        return ch_title, self._image_refs(lines)
@@ -1,6 +1,5 @@
 from bs4 import BeautifulSoup
 import re
-import requests
 from parser import Parser
 
 
@@ -10,9 +9,15 @@ class ReadNovelFullParser(Parser):
 
     max_clients = 10
 
+    # chapter title and content, see parse_chapter
+    trim_regions = [
+        rb'<span[^>]*class="[^"]*\bchr-text\b[^>]*>',
+        rb'<div[^>]*id="chr-content"[^>]*>',
+    ]
+
     def grab(self, url, raw=False):
-        req = requests.get(url)
-        return req if raw else req.text
+        req = self._get(url)
+        return req if raw else self._record_encoding(req).content
 
     def _link_to_num(self, link):
         if "/prologue.html" in link:
@@ -22,7 +27,7 @@ class ReadNovelFullParser(Parser):
 
     def parse_homepage(self, url):
         html = self.grab(url)
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         title = soup.find("h3", {"class": "title"}).text
         desc = soup.find("div", {"class": "desc-text"}).text  # .strip()
@@ -34,7 +39,7 @@ class ReadNovelFullParser(Parser):
         # readnovelfull has an alternate frontend where chapters links are
         ajax_url = f"{self.base_url}/ajax/chapter-archive?novelId={novelId}"
         ajax_html = self.grab(ajax_url)
-        soup_ajax = BeautifulSoup(ajax_html, "lxml")
+        soup_ajax = BeautifulSoup(self.decode(ajax_html), "lxml")
 
         anchor_tags = soup_ajax.find_all("a")
         chapter_links_raw = [anchor["href"] for anchor in anchor_tags]
@@ -60,11 +65,16 @@ class ReadNovelFullParser(Parser):
         }
 
     def parse_chapter(self, html, blacklist):
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         ch_title = soup.find("span", {"class": "chr-text"}).get_text(strip=True)
 
-        body = soup.find("div", {"id": "chr-content"}).find_all("p")
+        content = soup.find("div", {"id": "chr-content"})
+        # images outside a <p> would be skipped below
+        for img in content.find_all("img"):
+            if img.find_parent("p") is None:
+                img.wrap(soup.new_tag("p"))
+        body = self._mark_images(content).find_all("p")
         body_str = "\n".join([x.get_text() for x in body])
 
         # Removing blacklisted text
@@ -73,4 +83,4 @@ class ReadNovelFullParser(Parser):
 
         lines = [l.strip() for l in cleaned_body.splitlines() if l.strip()]
 
-        return ch_title, lines
+        return ch_title, self._image_refs(lines)
@@ -1,6 +1,5 @@
 from bs4 import BeautifulSoup
 import re
-import requests
 from parser import Parser
 
 
@@ -10,13 +9,25 @@ class WattpadParser(Parser):
 
     max_clients = 2
 
+    # chapter title and content, see parse_chapter
+    trim_regions = [
+        rb'<h1[^>]*class="[^"]*\bh2\b[^>]*>',
+        rb'<div[^>]*class="[^"]*\bfirst-page\b[^>]*>',
+    ]
+
     def grab(self, url, raw=False):
         # Wattpad requires an agent request
         AGENT = (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/105.0.0.0 Safari/537.36"
         )
-        req = requests.get(url, headers={"User-Agent": AGENT})
-        return req if raw else req.text
+        req = self._get(url, headers={"User-Agent": AGENT})
+        return req if raw else self._record_encoding(req).content
+
+    def trim_chapter(self, html):
+        # paywalled chapters are kept whole so parse_chapter can still detect the paywall
+        if b"paywall-container" in html:
+            return html
+        return super().trim_chapter(html)
 
     def _link_to_name(self, link):
         first = -1
@@ -30,7 +41,7 @@ class WattpadParser(Parser):
 
     def parse_homepage(self, url):
         html = self.grab(url)
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         title = self._link_to_name(url)
         desc = "WIP"  # wattpad has a very inconvenient website layout to parse
@@ -60,7 +71,7 @@ class WattpadParser(Parser):
         }
 
     def parse_chapter(self, html, blacklist):
-        soup = BeautifulSoup(html, "lxml")
+        soup = BeautifulSoup(self.decode(html), "lxml")
 
         ch_title = soup.find("h1", {"class": "h2"}).get_text(strip=True)
         
@@ -71,7 +82,7 @@ class WattpadParser(Parser):
 
         else:
             # free chapter
-            body = soup.find("div", {"class": "first-page"}).find("pre")
+            body = self._mark_images(soup.find("div", {"class": "first-page"}).find("pre"))
             bstr = ""
             for b in body:
                 bstr += b.get_text().strip() + "\n"
@@ -82,4 +93,4 @@ class WattpadParser(Parser):
 
             lines = [l.strip() for l in cleaned_body.splitlines() if l.strip()]
 
-        return ch_title, lines
+        return ch_title, self._image_refs(lines)
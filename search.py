@@ -0,0 +1,147 @@
+import sqlite3, os, json, zipfile
+from bs4 import BeautifulSoup
+
+# chapters written per transaction, so other runs sharing the index
+# only ever wait for one short write
+INDEX_BATCH = 200
+
+
+def index_path(base):
+    """Location of the full-text index for the output directory base"""
+    return os.path.join(base, "search_index.db")
+
+
+def open_index(path):
+    """
+    Opens the full-text index at path (created if it doesn't exist)
+    Returns sqlite3 connection
+    """
+    # several novels can be parsed into the same index at once,
+    # wait for the other writer instead of failing after 5 seconds
+    conn = sqlite3.connect(path, timeout=60)
+    # docs maps (novel, chapter) to the rowid of its fts entry
+    # so a chapter can be replaced without scanning the fts table
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS docs (
+            id INTEGER PRIMARY KEY,
+            novel TEXT NOT NULL,
+            chapter INTEGER NOT NULL,
+            UNIQUE (novel, chapter)
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS chapters USING fts5(title, body);
+        """
+    )
+    return conn
+
+
+def index_chapter(conn, novel, chn, title, body):
+    """
+    Adds or replaces chapter chn of novel in the index
+    body is the body_list returned by Parser.parse_chapter
+    Caller is responsible for committing
+    """
+    conn.execute(
+        "INSERT OR IGNORE INTO docs (novel, chapter) VALUES (?, ?)", (novel, chn)
+    )
+    (doc_id,) = conn.execute(
+        "SELECT id FROM docs WHERE novel = ? AND chapter = ?", (novel, chn)
+    ).fetchone()
+
+    conn.execute("DELETE FROM chapters WHERE rowid = ?", (doc_id,))
+    conn.execute(
+        "INSERT INTO chapters (rowid, title, body) VALUES (?, ?, ?)",
+        (doc_id, title, "\n".join(l for l in body if isinstance(l, str))),
+    )
+
+
+def index_chapters(conn, novel, chapters):
+    """
+    Adds or replaces chapters, list of tuples: (chapter, title, body), of novel
+    Written and committed in one transaction
+    """
+    with conn:
+        for chn, title, body in chapters:
+            index_chapter(conn, novel, chn, title, body)
+
+
+def remove_novel(conn, novel):
+    """Drops every chapter of novel from the index"""
+    conn.execute(
+        "DELETE FROM chapters WHERE rowid IN (SELECT id FROM docs WHERE novel = ?)",
+        (novel,),
+    )
+    conn.execute("DELETE FROM docs WHERE novel = ?", (novel,))
+
+
+def index_novel(conn, novel_dir):
+    """
+    Indexes a novel from its parsed_chapters.zip and metadata.json (no network needed)
+    Returns number of chapters indexed
+    """
+    novel = os.path.basename(novel_dir)
+    zip_name = os.path.join(novel_dir, "parsed_chapters.zip")
+    metadata_file_name = os.path.join(novel_dir, "metadata.json")
+
+    with open(metadata_file_name, "r") as f:
+        metadata = json.loads(f.read())
+
+    with conn:
+        remove_novel(conn, novel)
+
+    count = 0
+    pending = []
+    with zipfile.ZipFile(zip_name, "r") as zf:
+        for filename in zf.namelist():
+            chn = int(filename.split(".")[0])
+            soup = BeautifulSoup(zf.read(filename).decode("utf-8"), "lxml")
+            body = [p.get_text() for p in soup.find_all("p")]
+            pending.append((chn, metadata.get(str(chn), ""), body))
+            count += 1
+            if len(pending) >= INDEX_BATCH:
+                index_chapters(conn, novel, pending)
+                pending = []
+    index_chapters(conn, novel, pending)
+    return count
+
+
+def rebuild_index(base):
+    """
+    Rebuilds the full-text index for every novel archived in the output directory base
+    Returns total number of chapters indexed
+    """
+    if not os.path.isdir(base):
+        return 0
+
+    conn = open_index(index_path(base))
+    total = 0
+    for folder in sorted(os.listdir(base)):
+        novel_dir = os.path.join(base, folder)
+        if not os.path.isfile(
+            os.path.join(novel_dir, "parsed_chapters.zip")
+        ) or not os.path.isfile(os.path.join(novel_dir, "metadata.json")):
+            continue
+        print(f"indexing {folder}")
+        total += index_novel(conn, novel_dir)
+    conn.close()
+    return total
+
+
+def search(conn, phrase, limit=20):
+    """
+    Searches the index for phrase
+    Returns list of tuples: (novel, chapter, chapter_title, snippet)
+    """
+    # quoted so the phrase is matched as-is instead of as fts5 query syntax
+    query = '"' + phrase.replace('"', '""') + '"'
+    return conn.execute(
+        """
+        SELECT docs.novel, docs.chapter, chapters.title,
+               snippet(chapters, 1, '[', ']', '...', 16)
+        FROM chapters JOIN docs ON docs.id = chapters.rowid
+        WHERE chapters MATCH ?
+        ORDER BY rank
+        LIMIT ?
+        """,
+        (query, limit),
+    ).fetchall()
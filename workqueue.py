@@ -0,0 +1,216 @@
+import sqlite3, time, zipfile
+
+# shared download queue (a sqlite file) so several workers, each with its own
+# connection to the site, can download one novel:
+#   the coordinator publishes the chapters to download
+#   workers claim ranges of chapters for lease seconds and upload the raw html
+#   the coordinator merges uploaded chapters into raw_chapters.zip
+# a claim whose lease expires goes back to the queue, only the first upload
+# of a chapter is kept, and merging skips chapters already in the archive
+# so every chapter ends up in the archive exactly once
+
+MAX_ATTEMPTS = 3
+
+
+def open_queue(path):
+    """
+    Opens the queue at path (created if it doesn't exist)
+    Returns sqlite3 connection
+    """
+    # rollback journal (the default) instead of WAL so the file also works
+    # from several hosts on a shared filesystem with working locks
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS novels (
+            novel TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            trim INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tasks (
+            novel TEXT NOT NULL,
+            chapter INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (novel, chapter)
+        );
+        CREATE TABLE IF NOT EXISTS results (
+            novel TEXT NOT NULL,
+            chapter INTEGER NOT NULL,
+            data BLOB,
+            worker TEXT NOT NULL,
+            merged INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (novel, chapter)
+        );
+        """
+    )
+    return conn
+
+
+def publish(conn, novel, url, links, trim=True):
+    """
+    Adds the chapters in links {chapter: url} of novel to the queue
+    url is the novel homepage, used by workers to pick a parser
+    links should only hold chapters missing from the archive, so chapters already
+    in the queue are reset (done, failed or merged before, they aren't archived)
+    Chapters uploaded but not merged yet are kept, the next merge archives them
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    unmerged = {
+        chn
+        for (chn,) in conn.execute(
+            "SELECT chapter FROM results WHERE novel = ? AND merged = 0", (novel,)
+        )
+    }
+    rows = [(novel, chn, link) for chn, link in links.items() if chn not in unmerged]
+
+    conn.execute(
+        "INSERT OR REPLACE INTO novels (novel, url, trim) VALUES (?, ?, ?)",
+        (novel, url, int(trim)),
+    )
+    conn.executemany(
+        """
+        INSERT INTO tasks (novel, chapter, url) VALUES (?, ?, ?)
+        ON CONFLICT (novel, chapter) DO UPDATE SET
+            url = excluded.url, worker = NULL, lease_expires = NULL, attempts = 0, done = 0
+        """,
+        rows,
+    )
+    conn.executemany(
+        "DELETE FROM results WHERE novel = ? AND chapter = ?",
+        [(novel, chn) for novel, chn, _ in rows],
+    )
+    conn.execute("COMMIT")
+
+
+def novel_info(conn, novel):
+    """Returns tuple: (homepage url, trim) of a published novel"""
+    url, trim = conn.execute(
+        "SELECT url, trim FROM novels WHERE novel = ?", (novel,)
+    ).fetchone()
+    return url, bool(trim)
+
+
+def claim(conn, worker, batch, lease):
+    """
+    Claims up to batch chapters (lowest first, all from one novel) for lease seconds
+    Chapters whose lease expired can be claimed again
+    Returns list of tuples: (novel, chapter, url)
+    """
+    now = time.time()
+    available = """
+        done = 0 AND attempts < ?
+        AND (lease_expires IS NULL OR lease_expires < ?)
+    """
+
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute(
+        f"SELECT novel FROM tasks WHERE {available} ORDER BY novel, chapter LIMIT 1",
+        (MAX_ATTEMPTS, now),
+    ).fetchone()
+    if row is None:
+        conn.execute("COMMIT")
+        return []
+
+    tasks = conn.execute(
+        f"""
+        SELECT novel, chapter, url FROM tasks
+        WHERE novel = ? AND {available}
+        ORDER BY chapter LIMIT ?
+        """,
+        (row[0], MAX_ATTEMPTS, now, batch),
+    ).fetchall()
+    conn.executemany(
+        "UPDATE tasks SET worker = ?, lease_expires = ? WHERE novel = ? AND chapter = ?",
+        [(worker, now + lease, novel, chn) for novel, chn, _ in tasks],
+    )
+    conn.execute("COMMIT")
+    return tasks
+
+
+def renew(conn, worker, lease):
+    """Extends the lease on every unfinished chapter claimed by worker"""
+    conn.execute(
+        "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND done = 0",
+        (time.time() + lease, worker),
+    )
+
+
+def complete(conn, worker, novel, chn, data):
+    """
+    Uploads the raw html of a claimed chapter
+    Only the first upload of a chapter is kept (a late worker whose lease expired is ignored)
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(
+        "INSERT OR IGNORE INTO results (novel, chapter, data, worker) VALUES (?, ?, ?, ?)",
+        (novel, chn, data, worker),
+    )
+    conn.execute(
+        "UPDATE tasks SET done = 1 WHERE novel = ? AND chapter = ?", (novel, chn)
+    )
+    conn.execute("COMMIT")
+
+
+def release(conn, worker, novel, chn):
+    """Gives a claimed chapter back to the queue after a failed download"""
+    conn.execute(
+        """
+        UPDATE tasks SET worker = NULL, lease_expires = NULL, attempts = attempts + 1
+        WHERE novel = ? AND chapter = ? AND worker = ? AND done = 0
+        """,
+        (novel, chn, worker),
+    )
+
+
+def remaining(conn, novel=None):
+    """Returns number of chapters (of novel, or of every novel) still to be downloaded"""
+    query = "SELECT COUNT(*) FROM tasks WHERE done = 0 AND attempts < ?"
+    params = (MAX_ATTEMPTS,)
+    if novel is not None:
+        query += " AND novel = ?"
+        params += (novel,)
+    return conn.execute(query, params).fetchone()[0]
+
+
+def failed(conn, novel):
+    """Returns list of chapters of novel that failed MAX_ATTEMPTS downloads"""
+    rows = conn.execute(
+        "SELECT chapter FROM tasks WHERE novel = ? AND done = 0 AND attempts >= ? ORDER BY chapter",
+        (novel, MAX_ATTEMPTS),
+    ).fetchall()
+    return [chn for (chn,) in rows]
+
+
+def merge(conn, novel, zip_name):
+    """
+    Writes the uploaded chapters of novel into zip_name (only the coordinator should merge)
+    Chapters already in the archive are not written again, so a merge interrupted
+    between writing the archive and marking the results is safe to repeat
+    Returns number of chapters merged
+    """
+    rows = conn.execute(
+        "SELECT chapter, data FROM results WHERE novel = ? AND merged = 0",
+        (novel,),
+    ).fetchall()
+    if not rows:
+        return 0
+
+    with zipfile.ZipFile(zip_name, "a", compression=zipfile.ZIP_DEFLATED) as zf:
+        archived = set(zf.namelist())
+        for chn, data in rows:
+            filename = f"{chn}.chapter"
+            if filename not in archived:
+                zf.writestr(filename, data)
+
+    # raw html is dropped from the queue once it is in the archive
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(
+        "UPDATE results SET merged = 1, data = NULL WHERE novel = ? AND chapter = ?",
+        [(novel, chn) for chn, _ in rows],
+    )
+    conn.execute("COMMIT")
+    return len(rows)